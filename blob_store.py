@@ -0,0 +1,81 @@
+"""
+Content-addressed store for large cell outputs
+
+Rendered outputs such as base64 images can be megabytes per cell. They are
+moved into files named by their SHA-256 digest on load, so the staged cells
+only carry a small {"__blob__": digest} reference until the notebook is rebuilt.
+"""
+import hashlib
+import orjson
+import shutil
+from pathlib import Path
+from typing import Any, Dict
+
+BLOB_KEY = "__blob__"
+# Output fields that are moved out of the cell
+BLOB_MIME_TYPES = ("image/png", "text/html")
+# Encoded size in bytes above which such a field is moved
+BLOB_MIN_BYTES = 1024
+
+def put(store_dir: str, data: bytes) -> str:
+    """
+    Store bytes under their SHA-256 digest
+
+    Args:
+        store_dir: Root directory of the store
+        data: Content to store
+
+    Returns:
+        Hex digest identifying the content
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = Path(store_dir) / digest[:2] / digest
+    # Identical outputs share one file
+    if not blob_path.exists():
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        blob_path.write_bytes(data)
+    return digest
+
+def get(store_dir: str, digest: str) -> bytes:
+    """Read the content stored under a digest"""
+    return (Path(store_dir) / digest[:2] / digest).read_bytes()
+
+def intern_outputs(cell: Dict[str, Any], store_dir: str) -> None:
+    """
+    Replace large output fields of a cell with blob references, in place
+
+    Args:
+        cell: Notebook cell; cells without outputs are left unchanged
+        store_dir: Root directory of the store
+    """
+    for output in cell.get("outputs", ()):
+        data = output.get("data")
+        if not data:
+            continue
+        for mime_type in BLOB_MIME_TYPES:
+            if mime_type not in data:
+                continue
+            # Store the JSON encoding so multiline (list) values round-trip exactly
+            encoded = orjson.dumps(data[mime_type])
+            if len(encoded) > BLOB_MIN_BYTES:
+                data[mime_type] = {BLOB_KEY: put(store_dir, encoded)}
+
+def resolve_outputs(cell: Dict[str, Any], store_dir: str) -> None:
+    """
+    Replace blob references in the outputs of a cell with their content, in place
+
+    Args:
+        cell: Notebook cell processed by intern_outputs
+        store_dir: Root directory of the store
+    """
+    for output in cell.get("outputs", ()):
+        data = output.get("data")
+        if not data:
+            continue
+        for mime_type, value in data.items():
+            if isinstance(value, dict) and BLOB_KEY in value:
+                data[mime_type] = orjson.loads(get(store_dir, value[BLOB_KEY]))
+
+def remove(store_dir: str) -> None:
+    """Delete the store directory and everything in it"""
+    shutil.rmtree(store_dir, ignore_errors=True)
@@ -1,287 +1,430 @@
 """
 Cell processing modules for different notebook cell types
 """
+import asyncio
+import logging
 import re
 from state import AgentState
-from llm_client import LLMClient, get_image_data
+from llm_client import LLMClient, create_http_client, fetch_image, strip_code_fences
 from config import get_translation_label, get_description_label
-from typing import Dict, Any
+from notebook_io import iter_cells, read_cell, stage_cell
+from typing import Any, BinaryIO, Dict, List, Literal, Optional, Tuple
 import copy
+from langgraph.graph import END
+from langgraph.types import Command
 
-# Initialize LLM client
-llm_client = LLMClient()
+logger = logging.getLogger(__name__)
 
-def process_markdown_cell(state: AgentState) -> AgentState:
+# Client of the event loop that last used it, as (loop, client)
+_llm_client: Optional[Tuple[asyncio.AbstractEventLoop, LLMClient]] = None
+
+def get_llm_client() -> LLMClient:
     """
-    Process a markdown cell: translate text and describe images
+    Return the LLM client of the running event loop, creating it on first use
+    
+    The client's semaphore and connection pool are bound to the loop they are
+    first used in, so each asyncio.run() of a translation gets its own client.
+    """
+    global _llm_client
+    loop = asyncio.get_running_loop()
+    if _llm_client is None or _llm_client[0] is not loop:
+        _llm_client = (loop, LLMClient())
+    return _llm_client[1]
+
+# Regex to find images: ![alt](src)
+_IMAGE_RE = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+# Regex splitting markdown into sections: before a header line, or on a run of blank lines
+_SECTION_SPLIT_RE = re.compile(r'\n(?=#)|(?:^|\n)(?:[^\S\n]*(?:\n|\Z))+')
+# Regex matching a line with text that is not an image
+_TEXT_LINE_RE = re.compile(r'^(?!!).*\S', re.MULTILINE)
+# Regex matching spans kept verbatim instead of being translated: fenced code blocks,
+# display math on lines of its own, lines holding only image references and inline
+# data: URI images, which can be megabytes long. Inline $$...$$ stays in its prose span
+_VERBATIM_SPAN_RE = re.compile(
+    r'^(?P<fence>`{3,}|~{3,})[^\n]*\n.*?^(?P=fence)[^\S\n]*$'
+    r'|^\$\$[^\S\n]*\n.*?\n\$\$[^\S\n]*$'
+    r'|^\$\$[^$\n]+\$\$[^\S\n]*$'
+    r'|(?P<image>^[^\S\n]*(?:!\[[^\]\n]*\]\([^)\n]*\)[^\S\n]*)+$'
+    r'|!\[[^\]\n]*\]\(data:[^)\n]*\))',
+    re.MULTILINE | re.DOTALL
+)
+
+def _cell_source_text(cell: Dict[str, Any]) -> str:
+    """
+    Return the source of a cell as one string
+    
+    Notebook files may store the source as a list of lines that already end
+    with "\n"; those are joined once, and string sources are returned as is.
+    """
+    source = cell["source"]
+    return source if isinstance(source, str) else ''.join(source)
+
+def _split_markdown_sections(source_text: str) -> List[str]:
+    """
+    Split markdown into sections separated by blank lines or headers
     
     Args:
-        state: AgentState with current cell to process
+        source_text: Markdown source of a cell
         
     Returns:
-        Updated AgentState with processed cell added to processed_cells
+        List of sections; a header line starts a new section. Code blocks and
+        display math are never split, even if they contain blank lines or "#"
     """
-    try:
-        current_index = state["current_cell_index"]
-        if current_index >= len(state["notebook_content"]["cells"]):
-            state["error_message"] = "Cell index out of range"
-            return state
-            
-        cell = state["notebook_content"]["cells"][current_index]
-        
-        # Create a copy of the cell to modify
-        processed_cell = copy.deepcopy(cell)
-        
-        if cell["cell_type"] != "markdown":
-            state["error_message"] = f"Expected markdown cell, got {cell['cell_type']}"
-            return state
+    verbatim_spans = [match.span() for match in _VERBATIM_SPAN_RE.finditer(source_text)]
+    sections = []
+    start = 0
+    for match in _SECTION_SPLIT_RE.finditer(source_text):
+        if any(span_start < match.start() < span_end for span_start, span_end in verbatim_spans):
+            continue
+        sections.append(source_text[start:match.start()])
+        start = match.end()
+    sections.append(source_text[start:])
+    return [section for section in sections if section.strip()]
+
+def _tokenize_section(section: str) -> List[Tuple[str, str]]:
+    """
+    Split a section into ("text", ...), ("code", ...), ("math", ...) and ("image", ...) spans
+    
+    Only text spans are sent to the LLM; concatenating the spans gives back
+    the section.
+    """
+    spans = []
+    position = 0
+    for match in _VERBATIM_SPAN_RE.finditer(section):
+        if match.start() > position:
+            spans.append(("text", section[position:match.start()]))
+        if match.group("fence"):
+            kind = "code"
+        elif match.group("image"):
+            kind = "image"
+        else:
+            kind = "math"
+        spans.append((kind, match.group()))
+        position = match.end()
+    if position < len(section):
+        spans.append(("text", section[position:]))
+    return spans
+
+def _translatable_spans(section: str) -> List[Tuple[int, str]]:
+    """Return (span index, stripped text) of the text spans of a section that need translating"""
+    return [
+        (span_idx, span.strip()) for span_idx, (kind, span) in enumerate(_tokenize_section(section))
+        if kind == "text" and _TEXT_LINE_RE.search(span) is not None
+    ]
+
+def _stitch_translation(section: str, span_translations: Dict[int, str]) -> str:
+    """
+    Rebuild a section with its text spans replaced by their translations
+    
+    Code blocks, display math, images and untranslated spans are kept verbatim, along
+    with the whitespace around each translated span.
+    """
+    parts = []
+    for span_idx, (_, span) in enumerate(_tokenize_section(section)):
+        if span_idx in span_translations:
+            stripped = span.strip()
+            start = span.index(stripped)
+            span = span[:start] + span_translations[span_idx] + span[start + len(stripped):]
+        parts.append(span)
+    return "".join(parts).strip()
+
+def _find_image_sources(section: str) -> List[str]:
+    """Return the sources of all images referenced in a section"""
+    return [src for _, src in _IMAGE_RE.findall(section)]
+
+def _build_markdown_source(sections: List[str], translations: Dict[int, str],
+                           image_descriptions: Dict[int, List[str]],
+                           target_language: str) -> str:
+    """
+    Assemble the processed markdown source from original sections and results
+    
+    Args:
+        sections: Original sections of the cell
+        translations: Translated text keyed by section index
+        image_descriptions: Image descriptions keyed by section index
+        target_language: Target language used to pick the labels
         
-        original_source = cell["source"]
-        target_language = state["target_language"]
+    Returns:
+        Processed cell source as a single string
+    """
+    # Labels are looked up once per cell rather than once per section or image
+    description_label = get_description_label(target_language)
+    translation_label = get_translation_label(target_language)
+    new_source_lines = []
+    
+    for index, section in enumerate(sections):
+        # Add original section
+        new_source_lines.append(section)
         
-        # Process the source content
-        new_source_lines = []
+        # Add image descriptions for the section
+        for description in image_descriptions.get(index, []):
+            new_source_lines.extend(("", f"**{description_label}：**", description))
         
-        # Regex to find images: ![alt](src)
-        image_pattern = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+        # Add the translation if the section contained meaningful text
+        if index in translations:
+            new_source_lines.extend(("", f"**{translation_label}：**", translations[index]))
+            logger.info("✅ Translated section: %s...", section[:50])
         
-        # Process the content by sections (separated by blank lines or headers)
-        if isinstance(original_source, list):
-            source_text = ''.join(original_source)
-        else:
-            source_text = original_source
-        source_lines = source_text.split('\n')
+        # Add spacing between sections
+        new_source_lines.append("")
+    
+    # Join once; the trailing blank entry gives the source its final newline
+    return "\n".join(new_source_lines)
+
+def collect_translation_jobs(state: AgentState) -> List[Dict[str, Any]]:
+    """
+    Walk every cell of the notebook and collect the work that needs the LLM
+    
+    Args:
+        state: AgentState with the cells staged
         
-        current_section = []
-        sections = []
+    Returns:
+        List of {"cell_idx", "kind", "payload"} jobs, where kind is
+        "md_section", "code" or "image"; markdown jobs also carry "section_idx",
+        and "md_section" jobs the "span_idx" of their text span
+    """
+    jobs = []
+    
+    for cell_idx, cell in enumerate(iter_cells(state["raw_cells_path"], state["cell_index"])):
+        source_text = _cell_source_text(cell)
+        
+        if cell["cell_type"] == "markdown":
+            for section_idx, section in enumerate(_split_markdown_sections(source_text)):
+                for src in _find_image_sources(section):
+                    jobs.append({"cell_idx": cell_idx, "section_idx": section_idx,
+                                 "kind": "image", "payload": src})
+                for span_idx, text in _translatable_spans(section):
+                    jobs.append({"cell_idx": cell_idx, "section_idx": section_idx, "span_idx": span_idx,
+                                 "kind": "md_section", "payload": text})
+        elif cell["cell_type"] == "code" and source_text.strip():
+            # Blank cells would come back as empty segments and fail their whole batch
+            jobs.append({"cell_idx": cell_idx, "kind": "code", "payload": source_text})
+    
+    return jobs
+
+def apply_translation_results(state: AgentState, jobs: List[Dict[str, Any]],
+                              results: List[Optional[str]]) -> List[Tuple[int, int]]:
+    """
+    Build every processed cell from the results of the notebook-wide jobs
+    
+    Cells are streamed from the raw staging file and written to the output
+    staging file one at a time.
+    
+    Args:
+        state: AgentState with the cells staged
+        jobs: Jobs returned by collect_translation_jobs
+        results: Results of LLMClient.translate_jobs, in the same order as jobs
         
-        # Group lines into sections
-        for line in source_lines:
-            if line.strip() == "" or line.startswith('#'):
-                if current_section:
-                    sections.append(current_section)
-                    current_section = []
-                if line.strip():  # Add the header line to start new section
-                    current_section.append(line)
+    Returns:
+        (offset, length) of each processed cell in the output staging file
+    """
+    target_language = state["target_language"]
+    total_cells = len(state["cell_index"])
+    
+    # Index results by cell so each cell can be rebuilt independently
+    cell_results: Dict[int, List[tuple]] = {}
+    for job, result in zip(jobs, results):
+        cell_results.setdefault(job["cell_idx"], []).append((job, result))
+    
+    output_cell_index = []
+    cells = iter_cells(state["raw_cells_path"], state["cell_index"])
+    with open(state["output_staging_path"], "wb") as staging_file:
+        for cell_idx, cell in enumerate(cells):
+            # Each cell is freshly parsed from the staging file, so it is updated in place
+            if cell["cell_type"] == "markdown":
+                span_translations: Dict[int, Dict[int, str]] = {}
+                image_descriptions = {}
+                for job, result in cell_results.get(cell_idx, []):
+                    if result is None:
+                        continue
+                    if job["kind"] == "md_section":
+                        span_translations.setdefault(job["section_idx"], {})[job["span_idx"]] = result
+                    else:
+                        image_descriptions.setdefault(job["section_idx"], []).append(result)
+                sections = _split_markdown_sections(_cell_source_text(cell))
+                translations = {
+                    section_idx: _stitch_translation(sections[section_idx], translated)
+                    for section_idx, translated in span_translations.items()
+                }
+                cell["source"] = _build_markdown_source(
+                    sections, translations, image_descriptions, target_language
+                )
+                logger.info("📝 Processed markdown cell %s/%s", cell_idx + 1, total_cells)
+            elif cell["cell_type"] == "code":
+                for job, result in cell_results.get(cell_idx, []):
+                    cell["source"] = strip_code_fences(result)
+                logger.info("💻 Processed code cell %s/%s", cell_idx + 1, total_cells)
             else:
-                current_section.append(line)
-        
-        # Add the last section if exists
-        if current_section:
-            sections.append(current_section)
-        
-        # Process each section
-        for section in sections:
-            if not section:
-                continue
-                
-            section_text = '\n'.join(section)
-            
-            # Add original section
-            new_source_lines.extend(section)
-            
-            # Check for images in the section
-            image_matches = image_pattern.findall(section_text)
-            for alt_text, src in image_matches:
-                try:
-                    # Get image data and generate description
-                    # Pass input_path to resolve relative image paths
-                    image_data = get_image_data(src, state.get("input_path"))
-                    description = llm_client.describe_image(image_data, target_language)
-                    description_label = get_description_label(target_language)
-                    new_source_lines.append("")
-                    new_source_lines.append(f"**{description_label}：**")
-                    new_source_lines.append(description)
-                    print(f"✅ Generated image description for: {src}")
-                except Exception as e:
-                    print(f"⚠️ Could not process image {src}: {e}")
-            
-            # Translate the section if it contains meaningful text
-            if any(line.strip() and not line.startswith('!') for line in section):
-                try:
-                    # Translate the entire section
-                    translation = llm_client.translate_text(section_text, target_language)
-                    translation_label = get_translation_label(target_language)
-                    
-                    # Add translation with better formatting
-                    new_source_lines.append("")
-                    new_source_lines.append(f"**{translation_label}：**")
-                    new_source_lines.append(translation)
-                    print(f"✅ Translated section: {section_text[:50]}...")
-                except Exception as e:
-                    print(f"⚠️ Could not translate section: {e}")
+                logger.info("⏭️ Skipped %s cell %s/%s", cell['cell_type'], cell_idx + 1, total_cells)
             
-            # Add spacing between sections
-            new_source_lines.append("")
-        
-        # Update the cell source
-        processed_cell["source"] = new_source_lines
+            output_cell_index.append(stage_cell(staging_file, cell))
+    
+    return output_cell_index
+
+async def translate_notebook(state: AgentState) -> Command[Literal["process_cells", "rebuild_notebook", "__end__"]]:
+    """
+    Translate the whole notebook in one pass: collect jobs, batch them, scatter results
+    
+    The node routes itself: on success it goes straight to rebuild_notebook,
+    and if the batched pass fails it falls back to processing the notebook
+    cell by cell.
+    
+    Args:
+        state: AgentState with the cells staged
         
-        # Add to processed cells
-        state["processed_cells"].append(processed_cell)
-        state["current_cell_index"] += 1
+    Returns:
+        Command with the output_cell_index update and the next node
+    """
+    if state.get("error_message"):
+        return Command(goto=END)
+    
+    try:
+        jobs = collect_translation_jobs(state)
+        logger.info("📦 Collected %s translation jobs from %s cells", len(jobs), len(state['cell_index']))
         
-        print(f"📝 Processed markdown cell {current_index + 1}/{state['total_cells']}")
+        results = await get_llm_client().translate_jobs(jobs, state["target_language"], state.get("input_path"))
+        output_cell_index = apply_translation_results(state, jobs, results)
         
-        return state
+        logger.info("🎉 All cells processed successfully!")
+        return Command(update={"output_cell_index": output_cell_index}, goto="rebuild_notebook")
         
     except Exception as e:
-        state["error_message"] = f"Error processing markdown cell: {str(e)}"
-        print(f"Error: {state['error_message']}")
-        return state
+        logger.warning("⚠️ Batched translation failed, falling back to per-cell processing: %s", e)
+        return Command(goto="process_cells")
 
-def process_code_cell(state: AgentState) -> AgentState:
+async def process_markdown_cell(cell: Dict[str, Any], target_language: str,
+                                input_path: Optional[str] = None) -> Dict[str, Any]:
     """
-    Process a code cell: add explanatory comments and translate existing comments
+    Process a markdown cell: translate text and describe images
     
     Args:
-        state: AgentState with current cell to process
+        cell: Markdown cell to process
+        target_language: Target language for translation
+        input_path: Path of the notebook, used to resolve relative image paths
         
     Returns:
-        Updated AgentState with processed cell added to processed_cells
+        Processed copy of the cell
     """
+    # Only the source is replaced, so a shallow copy is enough
+    processed_cell = copy.copy(cell)
+    
+    # Process the content by sections (separated by blank lines or headers)
+    sections = _split_markdown_sections(_cell_source_text(cell))
+    
+    # Collect every translatable text span and image so the whole cell is sent in one request
+    translatable = [
+        (index, span_idx, text) for index, section in enumerate(sections)
+        for span_idx, text in _translatable_spans(section)
+    ]
+    image_refs = [
+        (index, src) for index, section in enumerate(sections)
+        for src in _find_image_sources(section)
+    ]
+    translations = {}
+    image_descriptions = {}
     try:
-        current_index = state["current_cell_index"]
-        if current_index >= len(state["notebook_content"]["cells"]):
-            state["error_message"] = "Cell index out of range"
-            return state
-            
-        cell = state["notebook_content"]["cells"][current_index]
-        
-        # Create a copy of the cell to modify
-        processed_cell = copy.deepcopy(cell)
-        
-        if cell["cell_type"] != "code":
-            state["error_message"] = f"Expected code cell, got {cell['cell_type']}"
-            return state
-        
-        original_source = cell["source"]
-        target_language = state["target_language"]
-        
-        # Convert source to string if it's a list
-        if isinstance(original_source, list):
-            code_content = ''.join(original_source)
+        section_texts = [text for _, _, text in translatable]
+        if image_refs:
+            async with create_http_client() as http_client:
+                fetched = await asyncio.gather(
+                    *[fetch_image(src, input_path, http_client) for _, src in image_refs],
+                    return_exceptions=True
+                )
+            images = [
+                (index, src, image_data) for (index, src), image_data in zip(image_refs, fetched)
+                if not isinstance(image_data, BaseException)
+            ]
+            translated_texts, descriptions = await get_llm_client().translate_cell_with_images(
+                section_texts, [image_data for _, _, image_data in images], target_language
+            )
+            for (index, src, _), description in zip(images, descriptions):
+                image_descriptions.setdefault(index, []).append(description)
+                logger.info("✅ Generated image description for: %s", src)
         else:
-            code_content = original_source
-        
-        try:
-            # Add comments and translate existing ones
-            enhanced_code = llm_client.add_code_comments(code_content, target_language)
-            
-            # Clean up any markdown code block wrapping that might have been added
-            enhanced_code = enhanced_code.strip()
-            if enhanced_code.startswith('```python'):
-                enhanced_code = enhanced_code[9:]  # Remove ```python
-            elif enhanced_code.startswith('```'):
-                enhanced_code = enhanced_code[3:]   # Remove generic ```
-            if enhanced_code.endswith('```'):
-                enhanced_code = enhanced_code[:-3]  # Remove ending ```
-            enhanced_code = enhanced_code.strip()
-            
-            processed_cell["source"] = enhanced_code
-            print(f"✅ Enhanced code cell {current_index + 1}/{state['total_cells']}")
-        except Exception as e:
-            print(f"⚠️ Could not enhance code cell: {e}")
-            # Keep original code if enhancement fails
-            processed_cell["source"] = original_source
-        
-        # Add to processed cells
-        state["processed_cells"].append(processed_cell)
-        state["current_cell_index"] += 1
-        
-        print(f"💻 Processed code cell {current_index + 1}/{state['total_cells']}")
-        
-        return state
-        
+            translated_texts = await get_llm_client().translate_batch(section_texts, target_language)
+        span_translations: Dict[int, Dict[int, str]] = {}
+        for (index, span_idx, _), translated_text in zip(translatable, translated_texts):
+            span_translations.setdefault(index, {})[span_idx] = translated_text
+        translations = {
+            index: _stitch_translation(sections[index], translated)
+            for index, translated in span_translations.items()
+        }
     except Exception as e:
-        state["error_message"] = f"Error processing code cell: {str(e)}"
-        print(f"Error: {state['error_message']}")
-        return state
+        logger.warning("⚠️ Could not process cell content: %s", e)
+    
+    processed_cell["source"] = _build_markdown_source(
+        sections, translations, image_descriptions, target_language
+    )
+    return processed_cell
 
-def route_cell_processing(state: AgentState) -> str:
+async def process_code_cell(cell: Dict[str, Any], target_language: str) -> Dict[str, Any]:
     """
-    Router function to determine which processing node to use next
+    Process a code cell: add explanatory comments and translate existing comments
     
     Args:
-        state: Current AgentState
+        cell: Code cell to process
+        target_language: Target language for comments
         
     Returns:
-        Next node name or END
+        Processed copy of the cell
     """
+    # Only the source is replaced, so a shallow copy is enough
+    processed_cell = copy.copy(cell)
+    
+    # Blank cells have nothing to comment
+    if not _cell_source_text(cell).strip():
+        return processed_cell
+    
     try:
-        # Check for errors
-        if state.get("error_message"):
-            return "END"
-        
-        # Check if we've processed all cells
-        current_index = state["current_cell_index"]
-        total_cells = state["total_cells"]
-        
-        if current_index >= total_cells:
-            print("🎉 All cells processed successfully!")
-            return "rebuild_notebook"
-        
-        # Get the current cell type
-        cell = state["notebook_content"]["cells"][current_index]
-        cell_type = cell["cell_type"]
-        
-        if cell_type == "markdown":
-            return "process_markdown_cell"
-        elif cell_type == "code":
-            return "process_code_cell"
-        else:
-            # For other cell types (raw, etc.), just copy as-is
-            processed_cell = copy.deepcopy(cell)
-            state["processed_cells"].append(processed_cell)
-            state["current_cell_index"] += 1
-            print(f"⏭️ Skipped {cell_type} cell {current_index + 1}/{total_cells}")
-            
-            # Check if there are more cells to process after skipping this one
-            if state["current_cell_index"] >= total_cells:
-                return "rebuild_notebook"
-            else:
-                # Get the next cell type to route to appropriate processor
-                next_cell = state["notebook_content"]["cells"][state["current_cell_index"]]
-                next_cell_type = next_cell["cell_type"]
-                if next_cell_type == "markdown":
-                    return "process_markdown_cell"
-                elif next_cell_type == "code":
-                    return "process_code_cell"
-                else:
-                    # If next cell is also unsupported, create a special routing
-                    return "skip_unsupported_cell"
-            
+        # Add comments and translate existing ones
+        enhanced_code = await get_llm_client().add_code_comments(_cell_source_text(cell), target_language)
+        processed_cell["source"] = strip_code_fences(enhanced_code)
     except Exception as e:
-        state["error_message"] = f"Error in routing: {str(e)}"
-        print(f"Error: {state['error_message']}")
-        return "END"
+        # Keep original code if enhancement fails
+        logger.warning("⚠️ Could not enhance code cell: %s", e)
+    
+    return processed_cell
 
-def skip_unsupported_cell(state: AgentState) -> AgentState:
+async def process_cells(state: AgentState) -> Dict[str, Any]:
     """
-    Skip unsupported cell types by copying them as-is
+    Per-cell fallback: process every cell of the notebook concurrently inside a single node
+    
+    The LLM client's semaphore (Config.LLM_CONCURRENCY) bounds how many
+    requests are in flight at once. Cells are written to the output staging
+    file as they finish.
     
     Args:
-        state: AgentState with current cell to process
+        state: AgentState with the cells staged
         
     Returns:
-        Updated AgentState with cell copied to processed_cells
+        State update with output_cell_index, or an error message
     """
+    cell_index = state["cell_index"]
+    target_language = state["target_language"]
+    
+    # Entries are stored by cell position so the notebook order is kept
+    output_cell_index: List[Optional[Tuple[int, int]]] = [None] * len(cell_index)
+    
+    async def process_one(cell_idx: int, staging_file: BinaryIO) -> None:
+        cell = read_cell(state["raw_cells_path"], cell_index[cell_idx])
+        if cell["cell_type"] == "markdown":
+            cell = await process_markdown_cell(cell, target_language, state.get("input_path"))
+            logger.info("📝 Processed markdown cell %s/%s", cell_idx + 1, len(cell_index))
+        elif cell["cell_type"] == "code":
+            cell = await process_code_cell(cell, target_language)
+            logger.info("💻 Processed code cell %s/%s", cell_idx + 1, len(cell_index))
+        else:
+            logger.info("⏭️ Skipped %s cell %s/%s", cell['cell_type'], cell_idx + 1, len(cell_index))
+        output_cell_index[cell_idx] = stage_cell(staging_file, cell)
+    
     try:
-        current_index = state["current_cell_index"]
-        if current_index >= len(state["notebook_content"]["cells"]):
-            return state
-            
-        cell = state["notebook_content"]["cells"][current_index]
-        
-        # Copy cell as-is
-        processed_cell = copy.deepcopy(cell)
-        state["processed_cells"].append(processed_cell)
-        state["current_cell_index"] += 1
-        
-        print(f"⏭️ Skipped {cell['cell_type']} cell {current_index + 1}/{state['total_cells']}")
+        with open(state["output_staging_path"], "wb") as staging_file:
+            await asyncio.gather(*[process_one(cell_idx, staging_file) for cell_idx in range(len(cell_index))])
         
-        return state
+        logger.info("🎉 All cells processed successfully!")
+        return {"output_cell_index": output_cell_index}
         
     except Exception as e:
-        state["error_message"] = f"Error skipping cell: {str(e)}"
-        return state 
\ No newline at end of file
+        error_message = f"Error processing cells: {str(e)}"
+        logger.error("Error: %s", error_message)
+        return {"error_message": error_message}
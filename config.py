@@ -18,6 +18,32 @@ class Config:
     # Default settings
     DEFAULT_TARGET_LANGUAGE = "Chinese"
     
+    # Batch translation limits (sections / input tokens per request)
+    MAX_BATCH_SECTIONS = int(os.getenv("MAX_BATCH_SECTIONS", "20"))
+    MAX_BATCH_TOKENS = int(os.getenv("MAX_BATCH_TOKENS", "3000"))
+    
+    # Code cells longer than this (characters) are split at top-level definitions
+    MAX_CODE_CHARACTERS = int(os.getenv("MAX_CODE_CHARACTERS", "4000"))
+    
+    # Maximum number of concurrent LLM requests
+    LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+    
+    # Persistent response cache
+    CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+    CACHE_PATH = os.getenv("CACHE_PATH", "~/.cache/nb-translate/cache.sqlite")
+    # Entries older than this many days are purged on startup (0 keeps them forever)
+    CACHE_MAX_AGE_DAYS = int(os.getenv("CACHE_MAX_AGE_DAYS", "30"))
+    
+    # Checkpoint each workflow step so an interrupted run resumes where it stopped
+    # (needs langgraph-checkpoint-sqlite)
+    CHECKPOINT_ENABLED = os.getenv("CHECKPOINT") == "1"
+    CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "~/.cache/nb-translate/checkpoints.sqlite")
+    
+    # Semantic cache for near-duplicate translations (needs sentence-transformers)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE") == "1"
+    SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.94"))
+    
     @classmethod
     def validate_config(cls):
         """Validate that required configuration is present"""
@@ -41,34 +67,37 @@ class Config:
         
         return True
 
+# Labels shown above translations and image descriptions, keyed by lowercased language
+TRANSLATION_LABELS = {
+    "chinese": "翻译",
+    "english": "Translation",
+    "spanish": "Traducción",
+    "french": "Traduction",
+    "german": "Übersetzung",
+    "japanese": "翻訳",
+    "korean": "번역",
+    "russian": "Перевод",
+    "portuguese": "Tradução",
+    "italian": "Traduzione"
+}
+
+DESCRIPTION_LABELS = {
+    "chinese": "图片说明",
+    "english": "Image Description",
+    "spanish": "Descripción de Imagen",
+    "french": "Description d'Image",
+    "german": "Bildbeschreibung",
+    "japanese": "画像説明",
+    "korean": "이미지 설명",
+    "russian": "Описание изображения",
+    "portuguese": "Descrição da Imagem",
+    "italian": "Descrizione dell'Immagine"
+}
+
 def get_translation_label(target_language: str) -> str:
     """Get the appropriate translation label for the target language"""
-    labels = {
-        "chinese": "翻译",
-        "english": "Translation", 
-        "spanish": "Traducción",
-        "french": "Traduction",
-        "german": "Übersetzung",
-        "japanese": "翻訳",
-        "korean": "번역",
-        "russian": "Перевод",
-        "portuguese": "Tradução",
-        "italian": "Traduzione"
-    }
-    return labels.get(target_language.lower(), "Translation")
+    return TRANSLATION_LABELS.get(target_language.lower(), "Translation")
 
 def get_description_label(target_language: str) -> str:
     """Get the appropriate image description label for the target language"""
-    labels = {
-        "chinese": "图片说明",
-        "english": "Image Description",
-        "spanish": "Descripción de Imagen", 
-        "french": "Description d'Image",
-        "german": "Bildbeschreibung",
-        "japanese": "画像説明",
-        "korean": "이미지 설명",
-        "russian": "Описание изображения",
-        "portuguese": "Descrição da Imagem",
-        "italian": "Descrizione dell'Immagine"
-    }
-    return labels.get(target_language.lower(), "Image Description") 
\ No newline at end of file
+    return DESCRIPTION_LABELS.get(target_language.lower(), "Image Description")
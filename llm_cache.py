@@ -0,0 +1,101 @@
+"""
+Persistent on-disk cache for LLM responses
+"""
+import hashlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_connection: Optional[sqlite3.Connection] = None
+
+def get_connection() -> sqlite3.Connection:
+    """Open the cache database once per process, create the table and purge expired entries"""
+    global _connection
+    if _connection is None:
+        cache_path = Path(Config.CACHE_PATH).expanduser()
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        _connection = sqlite3.connect(cache_path, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key BLOB PRIMARY KEY,
+                value TEXT,
+                ts INTEGER,
+                lang TEXT,
+                kind TEXT,
+                source TEXT
+            )
+            """
+        )
+        _purge_expired(_connection)
+        _connection.commit()
+    return _connection
+
+def _purge_expired(connection: sqlite3.Connection) -> None:
+    """Delete response and semantic cache entries older than Config.CACHE_MAX_AGE_DAYS"""
+    if Config.CACHE_MAX_AGE_DAYS <= 0:
+        return
+    cutoff = int(time.time()) - Config.CACHE_MAX_AGE_DAYS * 86400
+    deleted = connection.execute("DELETE FROM cache WHERE ts < ?", (cutoff,)).rowcount
+    try:
+        deleted += connection.execute("DELETE FROM semantic_cache WHERE ts < ?", (cutoff,)).rowcount
+    except sqlite3.OperationalError:
+        # The semantic cache table is created on first use by semantic_cache
+        pass
+    if deleted:
+        logger.info("🧹 Removed %s expired cache entries", deleted)
+
+def make_key(model_name: str, target_language: str, kind: str, text: str) -> bytes:
+    """
+    Build the cache key for an LLM request
+
+    Args:
+        model_name: Model used for the request
+        target_language: Target language of the request
+        kind: Type of task ("translate", "code_comments", "image")
+        text: Input text of the request
+
+    Returns:
+        SHA-256 digest identifying the request
+    """
+    return hashlib.sha256(f"{model_name}|{target_language}|{kind}|{text}".encode('utf-8')).digest()
+
+def get(key: bytes) -> Optional[str]:
+    """
+    Look up a cached response
+
+    Args:
+        key: Key built with make_key
+
+    Returns:
+        Cached response, or None on a cache miss
+    """
+    row = get_connection().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def put(key: bytes, value: str, lang: Optional[str] = None, kind: Optional[str] = None,
+        source: Optional[str] = None) -> None:
+    """
+    Store a response in the cache
+
+    Args:
+        key: Key built with make_key
+        value: Response to cache
+        lang: Target language, stored for debugging
+        kind: Type of task, stored for debugging
+        source: Plaintext input of the request, stored so entries can be audited
+    """
+    connection = get_connection()
+    connection.execute(
+        "INSERT OR REPLACE INTO cache (key, value, ts, lang, kind, source) VALUES (?, ?, ?, ?, ?, ?)",
+        (key, value, int(time.time()), lang, kind, source)
+    )
+    connection.commit()
@@ -1,29 +1,31 @@
 """
 LLM Client for interacting with OpenRouter API
 """
-from openai import OpenAI
+from openai import AsyncOpenAI
 from config import Config
+import llm_cache
+import semantic_cache
+import asyncio
 import base64
-import requests
-from typing import Union, Dict, Any, Optional
+import functools
+import hashlib
+import json
+import logging
+import re
+import httpx
+from typing import Union, Dict, Any, Optional, List, Tuple
 import os
 
-class LLMClient:
-    """Client for interacting with multimodal LLM via OpenRouter"""
-    
-    def __init__(self):
-        Config.validate_config()
-        self.client = OpenAI(
-            api_key=Config.API_KEY,
-            base_url=Config.MODEL_BASE_URL
-        )
-        self.model_name = Config.MODEL_NAME or "google/gemini-2.5-flash-preview-05-20"
-    
-    def translate_text(self, text: str, target_language: str) -> str:
-        """
-        Translate text to the target language while preserving Markdown formatting
-        """
-        prompt = f"""
+logger = logging.getLogger(__name__)
+
+# Lines where code can be split: top-level decorators ("@" followed by a name), definitions and "#%%" cell markers
+_CODE_CHUNK_RE = re.compile(r'(?m)^(?:@(?=[A-Za-z_])|(?:async[ \t]+)?def |class |#%%)')
+# Numbered markers that delimit the items of a batched prompt and its response
+_BATCH_MARKER_PREFIX = "<<<CELL "
+_BATCH_MARKER_RE = re.compile(r'<<<CELL (\d+)>>>')
+
+# Prompt templates; _specialize fills in the target language once per language
+_TRANSLATE_PROMPT = """
 You are a professional translator. You MUST translate the following text from English to {target_language}.
 
 CRITICAL REQUIREMENTS:
@@ -40,31 +42,9 @@ Examples:
 - English: "# Introduction" → Chinese: "# 简介"
 
 Text to translate to {target_language}:
-{text}
 """
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a professional translator specialized in maintaining Markdown formatting."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3
-            )
-            content = response.choices[0].message.content
-            return content.strip() if content else text
-        except Exception as e:
-            print(f"⚠️ Translation error: {e}")
-            if "401" in str(e) or "auth" in str(e).lower():
-                print("💡 Hint: Check your API key configuration in .env file")
-            return text  # Return original text if translation fails
-    
-    def add_code_comments(self, code: str, target_language: str) -> str:
-        """
-        Add explanatory comments to code and translate existing comments
-        """
-        prompt = f"""
+
+_CODE_COMMENT_PROMPT = """
 You are a coding expert and translator. Analyze the following code and:
 
 CRITICAL REQUIREMENTS:
@@ -84,50 +64,610 @@ import pandas as pd
 data = pd.read_csv('file.csv')
 
 Code to analyze and add {target_language} comments (return ONLY the commented code, no markdown wrapping):
-{code}
 """
+
+_CODE_COMMENT_SYSTEM = "You are a coding expert who adds helpful comments in {target_language}."
+
+_DESCRIBE_IMAGE_PROMPT = """
+Describe this image in detail in {target_language}. 
+Provide a comprehensive description that would help someone understand the content and context of the image.
+Focus on:
+1. Main objects, people, or subjects in the image
+2. Setting, background, and environment
+3. Colors, composition, and visual elements
+4. Any text or important details visible
+5. Overall mood or purpose of the image
+
+Provide only the description, no additional text.
+"""
+
+_token_encoder = None
+
+class LLMClient:
+    """Client for interacting with multimodal LLM via OpenRouter"""
+    
+    def __init__(self):
+        Config.validate_config()
+        self.client = AsyncOpenAI(
+            api_key=Config.API_KEY,
+            base_url=Config.MODEL_BASE_URL
+        )
+        self.model_name = Config.MODEL_NAME or "google/gemini-2.5-flash-preview-05-20"
+        # Bound the number of in-flight requests to avoid provider rate limits
+        self._semaphore = asyncio.Semaphore(Config.LLM_CONCURRENCY)
+    
+    async def _stream_chat(self, messages: List[Dict[str, Any]],
+                           max_markers: Optional[int] = None,
+                           response_format: Optional[Dict[str, str]] = None) -> str:
+        """
+        Stream a chat completion and return the accumulated text
         
-        try:
-            response = self.client.chat.completions.create(
+        The request waits for a free concurrency slot. When max_markers is
+        given, the stream is aborted with a ValueError as soon as the response
+        contains more batch markers than that, since it can no longer be split
+        into the expected segments. response_format is passed through to the
+        API (e.g. {"type": "json_object"}).
+        """
+        parts = []
+        markers = 0
+        tail = ""
+        
+        extra_params: Dict[str, Any] = {}
+        if response_format is not None:
+            extra_params["response_format"] = response_format
+        
+        async with self._semaphore:
+            stream = await self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[
-                    {"role": "system", "content": f"You are a coding expert who adds helpful comments in {target_language}."},
+                messages=messages,
+                temperature=0.3,
+                stream=True,
+                **extra_params
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                piece = chunk.choices[0].delta.content or ""
+                parts.append(piece)
+                
+                if max_markers is not None:
+                    # Only the tail of the previous pieces can hold a partial marker
+                    window = tail + piece
+                    markers += window.count(_BATCH_MARKER_PREFIX)
+                    tail = window[-(len(_BATCH_MARKER_PREFIX) - 1):]
+                    if markers > max_markers:
+                        await stream.close()
+                        raise ValueError(f"response has more than {max_markers} segments")
+        
+        return "".join(parts)
+    
+    async def _cache_get_many(self, kind: str, target_language: str, texts: List[str]) -> List[Optional[str]]:
+        """
+        Look up previous responses for the same model, language, task and inputs
+        
+        The exact-match cache is checked first; translation misses then fall
+        back to the semantic cache for near-duplicate inputs when it is enabled,
+        with all misses embedded in one batch.
+        """
+        if not Config.CACHE_ENABLED:
+            return [None] * len(texts)
+        results = [
+            llm_cache.get(llm_cache.make_key(self.model_name, target_language, kind, text))
+            for text in texts
+        ]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and kind == "translate" and Config.SEMANTIC_CACHE_ENABLED:
+            similar = await semantic_cache.lookup_many([texts[i] for i in missing], target_language, kind)
+            for i, value in zip(missing, similar):
+                results[i] = value
+        return results
+    
+    async def _cache_get(self, kind: str, target_language: str, text: str) -> Optional[str]:
+        """Look up a previous response for a single input"""
+        return (await self._cache_get_many(kind, target_language, [text]))[0]
+    
+    async def _cache_put(self, kind: str, target_language: str, text: str, value: str) -> None:
+        """Store a successful response so later runs can skip the request"""
+        if not Config.CACHE_ENABLED:
+            return
+        llm_cache.put(
+            llm_cache.make_key(self.model_name, target_language, kind, text),
+            value, lang=target_language, kind=kind, source=text
+        )
+        if kind == "translate" and Config.SEMANTIC_CACHE_ENABLED:
+            await semantic_cache.add(text, value, target_language, kind)
+    
+    async def _batch_with_cache(self, kind: str, texts: List[str], target_language: str,
+                                send_misses) -> List[str]:
+        """
+        Serve cached results and send only the cache misses with send_misses
+        
+        Results are returned in the same order as the input texts.
+        """
+        results = await self._cache_get_many(kind, target_language, texts)
+        missing = [i for i, result in enumerate(results) if result is None]
+        
+        if missing:
+            outputs = await send_misses([texts[i] for i in missing], target_language)
+            for i, output in zip(missing, outputs):
+                results[i] = output
+        
+        return results
+    
+    async def _send_sub_batches(self, texts: List[str], target_language: str,
+                                process_sub_batch) -> List[str]:
+        """
+        Send texts in concurrent sub-batches without consulting the cache
+        
+        Results are returned in the same order as the input texts.
+        """
+        batch_results = await asyncio.gather(*[
+            process_sub_batch(batch, target_language)
+            for batch in self._split_into_batches(texts)
+        ])
+        return [output for batch in batch_results for output in batch]
+    
+    async def _request_translation(self, text: str, target_language: str) -> str:
+        """Translate a single text that is known to be missing from the cache"""
+        prompt = _specialize(_TRANSLATE_PROMPT, target_language) + f"{text}\n"
+        
+        try:
+            content = await self._stream_chat(
+                [
+                    {"role": "system", "content": "You are a professional translator specialized in maintaining Markdown formatting."},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            if not content:
+                return text
+            await self._cache_put("translate", target_language, text, content.strip())
+            return content.strip()
+        except Exception as e:
+            logger.warning("⚠️ Translation error: %s", e)
+            if "401" in str(e) or "auth" in str(e).lower():
+                logger.warning("💡 Hint: Check your API key configuration in .env file")
+            return text  # Return original text if translation fails
+
+    async def translate_batch(self, texts: List[str], target_language: str) -> List[str]:
+        """
+        Translate several texts with as few requests as possible
+
+        Cached translations are served locally. The remaining texts are packed
+        into sub-batches bounded by Config.MAX_BATCH_SECTIONS and
+        Config.MAX_BATCH_TOKENS, and each sub-batch is sent as a single prompt.
+        Sub-batches are sent concurrently; results are returned in the same
+        order as the input texts.
+        """
+        return await self._batch_with_cache("translate", texts, target_language, self._translate_misses)
+    
+    async def _translate_misses(self, texts: List[str], target_language: str) -> List[str]:
+        """Translate texts that are known to be missing from the cache, in sub-batches"""
+        return await self._send_sub_batches(texts, target_language, self._translate_sub_batch)
+
+    async def translate_jobs(self, jobs: List[Dict[str, Any]], target_language: str,
+                             input_path: Optional[str] = None) -> List[Optional[str]]:
+        """
+        Run the translation jobs collected from a whole notebook
+        
+        Jobs are grouped by kind so markdown sections and code cells each get
+        their own batched prompts, and identical payloads are only processed
+        once. Payloads already in the response cache are resolved up front,
+        and only the misses are sent. Markdown cells that contain images are
+        sent as one fused request per cell instead. All requests run
+        concurrently, bounded by Config.LLM_CONCURRENCY.
+        
+        Args:
+            jobs: List of {"cell_idx", "kind", "payload"} dicts, where kind is
+                "md_section", "code" or "image"
+            target_language: Target language for translation
+            input_path: Path to the notebook file (used to resolve relative image paths)
+        
+        Returns:
+            Results in the same order as jobs, with None for failed image jobs
+        """
+        results: List[Optional[str]] = [None] * len(jobs)
+        
+        # Markdown cells with images get one fused request per cell
+        fused_cells: Dict[int, List[int]] = {
+            job["cell_idx"]: [] for job in jobs if job["kind"] == "image"
+        }
+        
+        # Identical payloads are sent once and the result fanned out to every job
+        unique_jobs: Dict[str, Dict[bytes, List[int]]] = {}
+        for job_index, job in enumerate(jobs):
+            if job["cell_idx"] in fused_cells:
+                fused_cells[job["cell_idx"]].append(job_index)
+                continue
+            unique_jobs.setdefault(job["kind"], {}).setdefault(
+                _payload_digest(job["payload"]), []
+            ).append(job_index)
+        
+        def payload_of(job_indices: List[int]) -> str:
+            return jobs[job_indices[0]]["payload"]
+        
+        # Triage: payloads with a cached result are filled in before any request is planned
+        cache_kinds = {"md_section": "translate", "code": "code_comments"}
+        cached_jobs = 0
+        for kind, groups in unique_jobs.items():
+            digests = list(groups)
+            cached_values = await self._cache_get_many(
+                cache_kinds[kind], target_language, [payload_of(groups[digest]) for digest in digests]
+            )
+            for digest, cached in zip(digests, cached_values):
+                if cached is not None:
+                    for job_index in groups[digest]:
+                        results[job_index] = cached
+                    cached_jobs += len(groups[digest])
+                    del groups[digest]
+        if cached_jobs:
+            logger.info("♻️ %s/%s jobs served from cache", cached_jobs, len(jobs))
+        
+        async def run_batch(kind: str, handler) -> None:
+            groups = list(unique_jobs.get(kind, {}).values())
+            if not groups:
+                return
+            outputs = await handler([payload_of(group) for group in groups], target_language)
+            for group, output in zip(groups, outputs):
+                for job_index in group:
+                    results[job_index] = output
+        
+        async def run_fused_cell(job_indices: List[int], http_client: httpx.AsyncClient) -> None:
+            section_jobs = [i for i in job_indices if jobs[i]["kind"] == "md_section"]
+            image_jobs = [i for i in job_indices if jobs[i]["kind"] == "image"]
+            fetched = await asyncio.gather(
+                *[fetch_image(jobs[i]["payload"], input_path, http_client) for i in image_jobs],
+                return_exceptions=True
+            )
+            # Images that could not be loaded are left without a description
+            loaded = [(i, data) for i, data in zip(image_jobs, fetched) if not isinstance(data, BaseException)]
+            
+            translations, descriptions = await self.translate_cell_with_images(
+                [jobs[i]["payload"] for i in section_jobs],
+                [data for _, data in loaded],
+                target_language
+            )
+            for job_index, translation in zip(section_jobs, translations):
+                results[job_index] = translation
+            for (job_index, _), description in zip(loaded, descriptions):
+                results[job_index] = description
+                logger.info("✅ Generated image description for: %s", jobs[job_index]['payload'][:80])
+        
+        # One pooled HTTP client is shared by every image fetch of the notebook
+        async with create_http_client() as http_client:
+            await asyncio.gather(
+                run_batch("md_section", self._translate_misses),
+                run_batch("code", self._comment_code_misses),
+                *[run_fused_cell(job_indices, http_client) for job_indices in fused_cells.values()]
+            )
+        
+        return results
+
+    async def translate_cell_with_images(self, texts: List[str], images: List[Union[bytes, str]],
+                                         target_language: str) -> Tuple[List[str], List[str]]:
+        """
+        Translate the sections of a markdown cell and describe its images together
+        
+        Cached results are served locally and the rest is sent as one fused
+        request. If that request fails or returns malformed JSON, the sections
+        are translated in batches and the images described one by one.
+        
+        Args:
+            texts: Sections of the cell to translate
+            images: Image bytes or data: URLs found in the cell
+            target_language: Target language for translation
+        
+        Returns:
+            Tuple of (translations, image descriptions), in input order
+        """
+        translations = await self._cache_get_many("translate", target_language, texts)
+        digests = [_image_digest(image) for image in images]
+        descriptions = await self._cache_get_many("image", target_language, digests)
+        missing_texts = [i for i, translation in enumerate(translations) if translation is None]
+        missing_images = [i for i, description in enumerate(descriptions) if description is None]
+        
+        if missing_images:
+            image_ids = [f"image_{n}" for n in range(len(missing_images))]
+            fused = await self.process_markdown_cell_llm(
+                [texts[i] for i in missing_texts],
+                {image_id: _image_url(images[i]) for image_id, i in zip(image_ids, missing_images)},
+                target_language
+            )
+            if fused is not None:
+                for i, translation in zip(missing_texts, fused["translations"]):
+                    translations[i] = translation
+                    await self._cache_put("translate", target_language, texts[i], translation)
+                for image_id, i in zip(image_ids, missing_images):
+                    descriptions[i] = fused["image_descriptions"][image_id]
+                    await self._cache_put("image", target_language, digests[i], descriptions[i])
+                return translations, descriptions
+        
+        # Legacy path: batched translation plus one request per image
+        translated, described = await asyncio.gather(
+            self._translate_misses([texts[i] for i in missing_texts], target_language),
+            asyncio.gather(*[self.describe_image(images[i], target_language) for i in missing_images])
+        )
+        for i, translation in zip(missing_texts, translated):
+            translations[i] = translation
+        for i, description in zip(missing_images, described):
+            descriptions[i] = description
+        return translations, descriptions
+
+    async def process_markdown_cell_llm(self, sections: List[str], image_urls: Dict[str, str],
+                                        target_language: str) -> Optional[Dict[str, Any]]:
+        """
+        Translate sections and describe images of one markdown cell in a single request
+        
+        Args:
+            sections: Sections of the cell to translate
+            image_urls: Image data: URLs keyed by image id
+            target_language: Target language for translation
+        
+        Returns:
+            {"translations": [...], "image_descriptions": {image_id: ...}}, or None
+            if the request fails or the response does not match that shape
+        """
+        image_ids = list(image_urls)
+        cell_input = json.dumps({"sections": sections, "images": image_ids}, ensure_ascii=False)
+        prompt = f"""
+You are a professional translator and image analyst. Process the content of a Jupyter Notebook markdown cell.
+
+CRITICAL REQUIREMENTS:
+1. Translate every entry of "sections" from English to {target_language}
+2. Preserve ALL Markdown formatting exactly and only translate the actual text content, not the Markdown syntax
+3. If there are code snippets, translate only the comments, not the code itself
+4. Describe each attached image in detail in {target_language}: main subjects, setting, colors and composition, visible text and overall purpose
+5. Return ONLY a JSON object of the form {{"translations": [...], "image_descriptions": {{"<image id>": "..."}}}}
+6. "translations" must contain exactly {len(sections)} strings, in the same order as "sections"
+7. "image_descriptions" must contain one description for every image id: {", ".join(image_ids)}
+
+Input:
+{cell_input}
+"""
+        content: List[Dict[str, Any]] = [{"type": "text", "text": prompt}]
+        for image_id, image_url in image_urls.items():
+            content.append({"type": "text", "text": f"{image_id}:"})
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+        
+        try:
+            response = await self._stream_chat(
+                [{"role": "user", "content": content}],
+                response_format={"type": "json_object"}
+            )
+            result = json.loads(response)
+            translations = result["translations"]
+            image_descriptions = result["image_descriptions"]
+            if (
+                len(translations) == len(sections)
+                and all(isinstance(t, str) and t.strip() for t in translations)
+                and all(isinstance(image_descriptions.get(i), str) for i in image_ids)
+            ):
+                return {
+                    "translations": [t.strip() for t in translations],
+                    "image_descriptions": {i: image_descriptions[i].strip() for i in image_ids}
+                }
+            logger.warning("⚠️ Fused cell response did not match the expected shape; processing separately")
+        except Exception as e:
+            logger.warning("⚠️ Fused cell request error: %s", e)
+        return None
+
+    def _split_into_batches(self, texts: List[str]) -> List[List[str]]:
+        """Group texts into sub-batches that respect the configured size limits"""
+        batches = []
+        current_batch = []
+        current_tokens = 0
+
+        for text in texts:
+            tokens = _count_tokens(text)
+            if current_batch and (
+                len(current_batch) >= Config.MAX_BATCH_SECTIONS
+                or current_tokens + tokens > Config.MAX_BATCH_TOKENS
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+            current_batch.append(text)
+            current_tokens += tokens
+
+        if current_batch:
+            batches.append(current_batch)
+
+        return batches
+
+    async def _request_segments(self, prompt: str, system_message: str,
+                          expected_count: int) -> Optional[List[str]]:
+        """
+        Send a batched prompt and split the response on its numbered markers
+        
+        Returns None if the request fails or the response does not contain
+        exactly one non-empty segment for each marker 0..expected_count-1.
+        """
+        try:
+            content = await self._stream_chat(
+                [
+                    {"role": "system", "content": system_message},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3
+                max_markers=expected_count
+            )
+            # re.split yields [preamble, index, segment, index, segment, ...]
+            parts = _BATCH_MARKER_RE.split(content)
+            indices = [int(index) for index in parts[1::2]]
+            segments = [segment.strip() for segment in parts[2::2]]
+            if indices == list(range(expected_count)) and all(segments):
+                return segments
+            logger.warning(
+                "⚠️ Batch request returned %s segments, expected %s; processing one by one",
+                len(segments), expected_count
             )
-            content = response.choices[0].message.content
-            return content.strip() if content else code
         except Exception as e:
-            print(f"⚠️ Code commenting error: {e}")
+            logger.warning("⚠️ Batch request error: %s", e)
             if "401" in str(e) or "auth" in str(e).lower():
-                print("💡 Hint: Check your API key configuration in .env file")
-            return code  # Return original code if processing fails
+                logger.warning("💡 Hint: Check your API key configuration in .env file")
+        return None
+
+    async def _translate_sub_batch(self, texts: List[str], target_language: str) -> List[str]:
+        """
+        Translate one sub-batch in a single request, falling back to one
+        request per text if the response cannot be split back into segments
+        """
+        if len(texts) == 1:
+            return [await self._request_translation(texts[0], target_language)]
+
+        joined_texts = _join_batch(texts)
+        prompt = f"""
+You are a professional translator. You MUST translate each of the following {len(texts)} text segments from English to {target_language}.
+
+CRITICAL REQUIREMENTS:
+1. Each segment starts with a marker line such as <<<CELL 0>>>
+2. Translate every segment independently and return exactly {len(texts)} translated segments in the same order
+3. Start each translated segment with the same marker line as its original, unchanged
+4. Preserve ALL Markdown formatting exactly (headers, links, bold, italic, code blocks, etc.)
+5. Only translate the actual text content, not the Markdown syntax
+6. If there are code snippets, translate only the comments, not the code itself
+7. Return ONLY the translated segments in {target_language}, no additional explanations
+8. If a segment is already in {target_language}, return it as-is
+
+Segments to translate to {target_language}:
+{joined_texts}
+"""
+
+        translations = await self._request_segments(
+            prompt,
+            "You are a professional translator specialized in maintaining Markdown formatting.",
+            len(texts)
+        )
+        if translations is not None:
+            for text, translation in zip(texts, translations):
+                await self._cache_put("translate", target_language, text, translation)
+            return translations
+        
+        return list(await asyncio.gather(*[
+            self._request_translation(text, target_language) for text in texts
+        ]))
+
+    async def add_code_comments(self, code: str, target_language: str) -> str:
+        """
+        Add explanatory comments to code and translate existing comments
+        
+        Code longer than Config.MAX_CODE_CHARACTERS is split at top-level
+        definitions and the chunks are commented concurrently, so a huge cell
+        never has to fit into a single request.
+        """
+        cached = await self._cache_get("code_comments", target_language, code)
+        if cached is not None:
+            return cached
+        return await self._request_code_comments(code, target_language)
     
-    def describe_image(self, image_data: bytes, target_language: str) -> str:
+    async def _request_code_comments(self, code: str, target_language: str) -> str:
+        """Comment code that is known to be missing from the cache, chunking it if it is large"""
+        if len(code) > Config.MAX_CODE_CHARACTERS:
+            chunks = _split_code_chunks(code)
+            if len(chunks) > 1:
+                commented = await asyncio.gather(*[
+                    self.add_code_comments(chunk, target_language) for chunk in chunks
+                ])
+                # Keep the blank lines after each chunk; the newline ending it is restored by the join
+                pieces = [
+                    strip_code_fences(result) + chunk[len(chunk.rstrip()):]
+                    for chunk, result in zip(chunks, commented)
+                ]
+                return "\n".join([piece.removesuffix("\n") for piece in pieces[:-1]] + pieces[-1:])
+        
+        prompt = _specialize(_CODE_COMMENT_PROMPT, target_language) + f"{code}\n"
+        
+        try:
+            content = await self._stream_chat(
+                [
+                    {"role": "system", "content": _specialize(_CODE_COMMENT_SYSTEM, target_language)},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+            if not content:
+                return code
+            await self._cache_put("code_comments", target_language, code, content.strip())
+            return content.strip()
+        except Exception as e:
+            logger.warning("⚠️ Code commenting error: %s", e)
+            if "401" in str(e) or "auth" in str(e).lower():
+                logger.warning("💡 Hint: Check your API key configuration in .env file")
+            return code  # Return original code if processing fails
+
+    async def _comment_code_misses(self, codes: List[str], target_language: str) -> List[str]:
+        """Comment code cells that are known to be missing from the cache"""
+        small = [i for i, code in enumerate(codes) if len(code) <= Config.MAX_CODE_CHARACTERS]
+        large = [i for i, code in enumerate(codes) if len(code) > Config.MAX_CODE_CHARACTERS]
+        
+        small_results, large_results = await asyncio.gather(
+            self._send_sub_batches([codes[i] for i in small], target_language, self._comment_code_sub_batch),
+            asyncio.gather(*[self._request_code_comments(codes[i], target_language) for i in large])
+        )
+        
+        results = list(codes)
+        for i, result in zip(small + large, list(small_results) + list(large_results)):
+            results[i] = result
+        return results
+
+    async def _comment_code_sub_batch(self, codes: List[str], target_language: str) -> List[str]:
         """
-        Generate a description of an image in the target language
+        Comment one sub-batch of code cells in a single request, falling back
+        to one request per cell if the response cannot be split back into cells
         """
-        # Convert image bytes to base64
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        if len(codes) == 1:
+            return [await self._request_code_comments(codes[0], target_language)]
         
+        joined_codes = _join_batch(codes)
         prompt = f"""
-Describe this image in detail in {target_language}. 
-Provide a comprehensive description that would help someone understand the content and context of the image.
-Focus on:
-1. Main objects, people, or subjects in the image
-2. Setting, background, and environment
-3. Colors, composition, and visual elements
-4. Any text or important details visible
-5. Overall mood or purpose of the image
+You are a coding expert and translator. Analyze each of the following {len(codes)} code cells and:
 
-Provide only the description, no additional text.
+CRITICAL REQUIREMENTS:
+1. Each code cell starts with a marker line such as <<<CELL 0>>>
+2. Process every code cell independently and return exactly {len(codes)} code cells in the same order
+3. Start each returned code cell with the same marker line as its original, unchanged
+4. Add detailed, line-by-line comments explaining what the code does
+5. Translate any existing English comments to {target_language}
+6. Keep the original code EXACTLY the same - only add/modify comments
+7. Write NEW comments in {target_language}
+8. Use appropriate comment syntax for the programming language (# for Python, // for JavaScript, etc.)
+9. IMPORTANT: Do NOT wrap the code in markdown code blocks (```). Return ONLY the commented code.
+
+Code cells to analyze and add {target_language} comments (return ONLY the commented code, no markdown wrapping):
+{joined_codes}
 """
         
+        commented_codes = await self._request_segments(
+            prompt,
+            _specialize(_CODE_COMMENT_SYSTEM, target_language),
+            len(codes)
+        )
+        if commented_codes is not None:
+            for code, commented_code in zip(codes, commented_codes):
+                await self._cache_put("code_comments", target_language, code, commented_code)
+            return commented_codes
+        
+        return list(await asyncio.gather(*[
+            self._request_code_comments(code, target_language) for code in codes
+        ]))
+    
+    async def describe_image(self, image_data: Union[bytes, str], target_language: str) -> str:
+        """
+        Generate a description of an image in the target language
+        
+        image_data is either raw image bytes or a ready data: URL, which is
+        sent to the model unchanged.
+        """
+        # Images are cached by the digest of their content
+        image_digest = _image_digest(image_data)
+        cached = await self._cache_get("image", target_language, image_digest)
+        if cached is not None:
+            return cached
+        
+        image_url = _image_url(image_data)
+        
+        prompt = _specialize(_DESCRIBE_IMAGE_PROMPT, target_language)
+        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
+            content = await self._stream_chat(
+                [
                     {
                         "role": "user",
                         "content": [
@@ -135,61 +675,179 @@ Provide only the description, no additional text.
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
+                                    "url": image_url
                                 }
                             }
                         ]
                     }
-                ],
-                temperature=0.3
+                ]
             )
-            content = response.choices[0].message.content
-            return content.strip() if content else f"[Unable to generate image description]"
+            if not content:
+                return f"[Unable to generate image description]"
+            await self._cache_put("image", target_language, image_digest, content.strip())
+            return content.strip()
         except Exception as e:
-            print(f"Image description error: {e}")
+            logger.warning("Image description error: %s", e)
             return f"[Unable to generate image description: {str(e)}]"
 
-def get_image_data(src: str, input_path: Optional[str] = None) -> bytes:
+@functools.lru_cache(maxsize=None)
+def _specialize(template: str, target_language: str) -> str:
+    """Fill the target language into a prompt template, once per template and language"""
+    return template.format(target_language=target_language)
+
+def _join_batch(texts: List[str]) -> str:
+    """Join the items of a batched prompt, each preceded by its numbered marker"""
+    return "\n".join(f"<<<CELL {index}>>>\n{text}" for index, text in enumerate(texts))
+
+def _count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text for batch budgeting
+    
+    Uses tiktoken when it is installed and its encoding can be loaded, and
+    falls back to the common estimate of four characters per token otherwise.
+    """
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _token_encoder = False
+        except Exception as e:
+            # The encoding is downloaded on first use, which can fail offline; don't retry on every call
+            logger.warning("⚠️ Could not load the tiktoken encoding, estimating token counts: %s", e)
+            _token_encoder = False
+    if _token_encoder is False:
+        return len(text) // 4 + 1
+    return len(_token_encoder.encode(text, disallowed_special=()))
+
+def _split_code_chunks(code: str) -> List[str]:
+    """
+    Split code before top-level definitions and "#%%" cell markers
+    
+    Decorators stay in the same chunk as the definition they decorate, and
+    any preamble before the first definition stays the first chunk. A line
+    starting with "@" only counts as a decorator when the next match after it
+    is a definition, so a stray "@" line, e.g. in a string or a matmul
+    continuation, cannot swallow the split before a following "#%%" marker.
+    
+    Args:
+        code: Source of a code cell
+    
+    Returns:
+        Non-blank chunks that concatenate back to the code
+    """
+    matches = [(match.start(), match.group()) for match in _CODE_CHUNK_RE.finditer(code)]
+    # Whether each "@" match is followed by a definition rather than a cell marker or the end
+    decorates = []
+    next_is_definition = False
+    for _, token in reversed(matches):
+        if token != "@":
+            next_is_definition = token != "#%%"
+        decorates.append(next_is_definition)
+    decorates.reverse()
+    
+    starts = [0]
+    after_decorator = False
+    for (start, token), is_decorator in zip(matches, decorates):
+        if token == "@" and not is_decorator:
+            continue
+        # A decorator can only be followed by another decorator or the definition itself
+        if start and not after_decorator:
+            starts.append(start)
+        after_decorator = token == "@"
+    starts.append(len(code))
+    return [code[start:end] for start, end in zip(starts, starts[1:]) if code[start:end].strip()]
+
+def strip_code_fences(code: str) -> str:
+    """Clean up any markdown code block wrapping that might have been added"""
+    code = code.strip().removeprefix('```python').removeprefix('```').removesuffix('```')
+    return code.strip()
+
+def _payload_digest(payload: str) -> bytes:
+    """Short digest used to spot identical job payloads within a notebook"""
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).digest()
+
+def _image_digest(image_data: Union[bytes, str]) -> str:
+    """Digest of an image (bytes or data: URL) used as its cache key"""
+    if isinstance(image_data, str):
+        return hashlib.sha256(image_data.encode('utf-8')).hexdigest()
+    return hashlib.sha256(image_data).hexdigest()
+
+def _image_url(image_data: Union[bytes, str]) -> str:
+    """Return a data: URL for the image, base64-encoding raw bytes exactly once"""
+    if isinstance(image_data, str):
+        return image_data
+    return f"data:image/jpeg;base64,{base64.b64encode(image_data).decode('utf-8')}"
+
+# Some image hosts reject requests without a descriptive User-Agent
+_HTTP_HEADERS = {
+    "User-Agent": "nb-translate-commit/0.1.0 (python-httpx)",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+def create_http_client() -> httpx.AsyncClient:
     """
-    Helper function to fetch image data from various sources
+    Create the shared HTTP client used to fetch remote images
+    
+    Connections are pooled and kept alive so images hosted on the same server
+    reuse TCP/TLS sessions while being fetched concurrently.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        headers=_HTTP_HEADERS,
+        timeout=30,
+        follow_redirects=True
+    )
+
+def _read_file(path: str) -> bytes:
+    """Read a local file as bytes"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+async def fetch_image(src: str, input_path: Optional[str],
+                      client: httpx.AsyncClient) -> Union[bytes, str]:
+    """
+    Fetch image data from various sources
     
     Args:
         src: Image source (URL, local path, or base64)
         input_path: Path to the notebook file (used to resolve relative paths)
+        client: Shared HTTP client from create_http_client
+    
+    Returns:
+        Image bytes, or the data: URL itself for base64 embedded images
     """
     try:
-        # Check if it's a base64 encoded image
+        # Base64 embedded images are already in the form the model expects,
+        # so skip the decode/re-encode round trip
         if src.startswith('data:image/'):
-            # Extract base64 data
-            base64_data = src.split(',')[1]
-            return base64.b64decode(base64_data)
+            return src
         
         # Check if it's a URL
         elif src.startswith('http://') or src.startswith('https://'):
-            response = requests.get(src, timeout=30)
+            response = await client.get(src)
             response.raise_for_status()
             return response.content
         
-        # Assume it's a local file path
+        # Assume it's a local file path; reads run in a thread to keep the loop free
         else:
             # Try absolute path first
             if os.path.exists(src):
-                with open(src, 'rb') as f:
-                    return f.read()
+                return await asyncio.to_thread(_read_file, src)
             
             # If not found and we have input_path, try relative to notebook directory
             elif input_path is not None:
                 notebook_dir = os.path.dirname(os.path.abspath(input_path))
                 relative_path = os.path.join(notebook_dir, src)
                 if os.path.exists(relative_path):
-                    with open(relative_path, 'rb') as f:
-                        return f.read()
+                    return await asyncio.to_thread(_read_file, relative_path)
                 else:
                     raise FileNotFoundError(f"Image file not found: {src} (tried absolute and relative to {notebook_dir})")
             else:
                 raise FileNotFoundError(f"Image file not found: {src}")
                 
     except Exception as e:
-        print(f"Error loading image from {src}: {e}")
+        logger.warning("Error loading image from %s: %s", src, e)
         # Return a placeholder or raise the exception
-        raise e 
\ No newline at end of file
+        raise e 
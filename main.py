@@ -3,6 +3,8 @@
 Main entry point for the Jupyter Notebook Translator
 """
 import argparse
+import asyncio
+import logging
 import sys
 import os
 from pathlib import Path
@@ -36,12 +38,24 @@ Supported languages: Chinese, English, Spanish, French, German, Japanese, Korean
         help=f"Target language for translation (default: {Config.DEFAULT_TARGET_LANGUAGE})"
     )
     
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Validate the notebook against the nbformat schema and stop if it is invalid"
+    )
+    
     parser.add_argument(
         "--check-config", "-c",
         action="store_true",
         help="Check configuration and exit"
     )
     
+    parser.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Only report warnings and errors while translating"
+    )
+    
     parser.add_argument(
         "--version", "-v",
         action="version",
@@ -50,6 +64,15 @@ Supported languages: Chinese, English, Spanish, French, German, Japanese, Korean
     
     args = parser.parse_args()
     
+    # Progress is reported through logging; the CLI prints plain messages
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format="%(message)s"
+    )
+    # httpx logs every request at INFO level (newer openai releases use httpx2)
+    for name in ("httpx", "httpx2"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    
     # Check configuration if requested
     if args.check_config:
         try:
@@ -100,10 +123,11 @@ Supported languages: Chinese, English, Spanish, French, German, Japanese, Korean
     
     # Run the translation
     try:
-        result = run_notebook_translation(
+        result = asyncio.run(run_notebook_translation(
             input_path=str(input_path),
-            target_language=args.target_language
-        )
+            target_language=args.target_language,
+            strict=args.strict
+        ))
         
         if result.get("error_message"):
             print(f"❌ Translation failed: {result['error_message']}")
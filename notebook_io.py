@@ -1,95 +1,192 @@
 """
 Jupyter Notebook I/O operations
 """
+import blob_store
+import logging
 import nbformat
+import orjson
 import os
 from pathlib import Path
 from state import AgentState
-from typing import Dict, Any
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
 
-def load_and_parse_notebook(state: AgentState) -> AgentState:
+logger = logging.getLogger(__name__)
+
+def stage_cell(staging_file: BinaryIO, cell: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Append one cell to a JSON-Lines staging file
+    
+    Args:
+        staging_file: Staging file opened for binary writing
+        cell: Cell to write
+    
+    Returns:
+        (offset, length) of the written line, used to read the cell back
+    """
+    line = orjson.dumps(cell, option=orjson.OPT_APPEND_NEWLINE)
+    offset = staging_file.tell()
+    staging_file.write(line)
+    return offset, len(line)
+
+def read_cell(staging_path: str, entry: Tuple[int, int]) -> Dict[str, Any]:
+    """Read a single cell back from a staging file by its (offset, length)"""
+    offset, length = entry
+    with open(staging_path, "rb") as staging_file:
+        staging_file.seek(offset)
+        return orjson.loads(staging_file.read(length))
+
+def iter_cells(staging_path: str, cell_index: List[Tuple[int, int]]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream cells from a staging file one at a time
+    
+    Args:
+        staging_path: JSON-Lines staging file
+        cell_index: (offset, length) of each cell, in the order to yield them
+    
+    Yields:
+        Parsed cells
+    """
+    with open(staging_path, "rb") as staging_file:
+        for offset, length in cell_index:
+            staging_file.seek(offset)
+            yield orjson.loads(staging_file.read(length))
+
+def staging_paths(input_path: str) -> Dict[str, str]:
+    """
+    Derive the output path and the staging locations of a run from its input
+    
+    Args:
+        input_path: Path to the input notebook
+    
+    Returns:
+        Dict with output_path, raw_cells_path, output_staging_path and blob_dir
+    """
+    source = Path(input_path)
+    output_path = source.parent / f"{source.stem}_translated{source.suffix}"
+    return {
+        "output_path": str(output_path),
+        "raw_cells_path": f"{output_path}.cells.tmp",
+        "output_staging_path": f"{output_path}.out.tmp",
+        "blob_dir": f"{output_path}.blobs.tmp"
+    }
+
+def cleanup_staging(state: Dict[str, Any]) -> None:
+    """Remove the staging files and blob store of a run, if any were created"""
+    for key in ("raw_cells_path", "output_staging_path"):
+        if state.get(key):
+            Path(state[key]).unlink(missing_ok=True)
+    if state.get("blob_dir"):
+        blob_store.remove(state["blob_dir"])
+
+def load_and_parse_notebook(state: AgentState) -> Dict[str, Any]:
     """
     Load and parse a Jupyter Notebook file
     
+    Cells are written to a JSON-Lines staging file next to the output so
+    only their offsets and the small notebook metadata are kept in state.
+    Large outputs are moved into a blob store and staged as references.
+    
     Args:
-        state: AgentState with input_path and target_language
+        state: AgentState with input_path, target_language and strict
     
     Returns:
-        Updated AgentState with notebook_content and other initialized fields
+        State update with notebook_meta, cell_index, the staging paths and
+        blob_dir, or an error message
     """
     try:
         # Validate input path
         if not os.path.exists(state["input_path"]):
-            state["error_message"] = f"Input file not found: {state['input_path']}"
-            return state
+            return {"error_message": f"Input file not found: {state['input_path']}"}
         
-        # Read the notebook
-        with open(state["input_path"], 'r', encoding='utf-8') as f:
-            notebook_content = nbformat.read(f, as_version=4)
+        # Read the notebook with orjson; nbformat is only needed to upgrade old versions
+        notebook_content = orjson.loads(Path(state["input_path"]).read_bytes())
+        if notebook_content.get("nbformat") != 4:
+            notebook_content = nbformat.convert(nbformat.from_dict(notebook_content), 4)
         
-        # Generate output path with _translated suffix
-        input_path = Path(state["input_path"])
-        output_path = input_path.parent / f"{input_path.stem}_translated{input_path.suffix}"
-        
-        # Update state
-        state.update({
-            "notebook_content": notebook_content,
-            "output_path": str(output_path),
-            "processed_cells": [],
-            "current_cell_index": 0,
-            "total_cells": len(notebook_content.cells),
-            "error_message": None
-        })
+        # Schema validation is slow on large notebooks, so it only runs in strict mode
+        if state.get("strict"):
+            try:
+                nbformat.validate(notebook_content)
+            except nbformat.ValidationError as e:
+                return {"error_message": f"Notebook does not match the nbformat schema: {e.message}"}
         
-        print(f"Loaded notebook: {state['input_path']}")
-        print(f"Total cells: {state['total_cells']}")
-        print(f"Output will be saved to: {state['output_path']}")
+        # Generate output path with _translated suffix
+        paths = staging_paths(state["input_path"])
+        output_path = Path(paths["output_path"])
+        output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        return state
+        # Stage the cells on disk and keep only the notebook-level fields in memory
+        cells = notebook_content.pop("cells")
+        cell_index = []
+        with open(paths["raw_cells_path"], "wb") as staging_file:
+            for cell in cells:
+                blob_store.intern_outputs(cell, paths["blob_dir"])
+                cell_index.append(stage_cell(staging_file, cell))
+        
+        logger.info("Loaded notebook: %s", state['input_path'])
+        logger.info("Total cells: %s", len(cell_index))
+        logger.info("Output will be saved to: %s", output_path)
+        
+        return {
+            **paths,
+            "notebook_meta": notebook_content,
+            "cell_index": cell_index,
+            "error_message": None
+        }
         
     except Exception as e:
-        state["error_message"] = f"Error loading notebook: {str(e)}"
-        print(f"Error: {state['error_message']}")
-        return state
+        error_message = f"Error loading notebook: {str(e)}"
+        logger.error("Error: %s", error_message)
+        return {"error_message": error_message}
 
-def rebuild_notebook(state: AgentState) -> AgentState:
+def rebuild_notebook(state: AgentState) -> Dict[str, Any]:
     """
-    Rebuild the notebook with processed cells and save to output path
+    Rebuild the notebook from the staged processed cells and save to output path
+    
+    Cells are streamed from the staging file one at a time, so the whole
+    translated notebook is never held in memory. Blob references in their
+    outputs are resolved as each cell is written.
     
     Args:
-        state: AgentState with processed_cells and output_path
+        state: AgentState with output_cell_index, output_staging_path, blob_dir and output_path
     
     Returns:
-        Updated AgentState with completion status
+        Empty state update, or an error message
     """
     try:
         if state.get("error_message"):
-            print(f"Cannot rebuild notebook due to error: {state['error_message']}")
-            return state
-        
-        # Create a copy of the original notebook structure
-        output_notebook = state["notebook_content"].copy()
-        
-        # Replace cells with processed ones
-        output_notebook["cells"] = state["processed_cells"]
+            logger.error("Cannot rebuild notebook due to error: %s", state['error_message'])
+            return {}
         
         # Ensure output directory exists
         output_path = Path(state["output_path"])
         output_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Write the notebook
-        with open(state["output_path"], 'w', encoding='utf-8') as f:
-            nbformat.write(output_notebook, f)
-        
-        print(f"✅ Translated notebook saved to: {state['output_path']}")
-        
-        return state
+        # Write the same layout as orjson.dumps(notebook, OPT_INDENT_2 | OPT_SORT_KEYS),
+        # plus a final newline like Jupyter: "cells" sorts before every other
+        # top-level key, so it is written first
+        option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        with open(output_path, "wb") as output_file:
+            output_file.write(b'{\n  "cells": [')
+            cells = iter_cells(state["output_staging_path"], state["output_cell_index"])
+            for position, cell in enumerate(cells):
+                blob_store.resolve_outputs(cell, state["blob_dir"])
+                output_file.write(b"," if position else b"")
+                output_file.write(b"\n    " + orjson.dumps(cell, option=option).replace(b"\n", b"\n    "))
+            output_file.write(b"\n  ]," if state["output_cell_index"] else b"],")
+            # Splice the remaining keys in after the opening brace of the metadata dump
+            output_file.write(
+                orjson.dumps(state["notebook_meta"], option=option | orjson.OPT_APPEND_NEWLINE)[1:]
+            )
+        
+        logger.info("✅ Translated notebook saved to: %s", state['output_path'])
+        
+        return {}
         
     except Exception as e:
         error_msg = f"Error saving notebook: {str(e)}"
-        state["error_message"] = error_msg
-        print(f"Error: {error_msg}")
-        return state
+        logger.error("Error: %s", error_msg)
+        return {"error_message": error_msg}
 
 def validate_notebook_structure(notebook_content: Dict[Any, Any]) -> bool:
     """
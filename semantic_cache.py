@@ -0,0 +1,143 @@
+"""
+Semantic cache for near-duplicate translations
+
+Inputs are embedded locally with sentence-transformers and compared by cosine
+similarity, so texts that differ only slightly from a previously translated one
+reuse its translation. Entries are scoped to the model that produced them and
+expire with the response cache. Requires the optional sentence-transformers
+package and is only used when SEMANTIC_CACHE=1.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from config import Config
+import llm_cache
+
+_model = None
+_model_lock = threading.Lock()
+# Normalized embeddings and cached values, grouped by (lang, kind)
+_entries: Optional[Dict[Tuple[str, str], Tuple[list, List[str]]]] = None
+_matrices: Dict[Tuple[str, str], object] = {}
+
+def _get_model():
+    """Load the embedding model on first use"""
+    global _model
+    # Embeddings run in worker threads, so the model must only be loaded once
+    with _model_lock:
+        if _model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError(
+                    "SEMANTIC_CACHE=1 requires sentence-transformers. "
+                    "Install it with: pip install sentence-transformers"
+                ) from e
+            _model = SentenceTransformer(Config.SEMANTIC_CACHE_MODEL)
+    return _model
+
+def _get_connection() -> sqlite3.Connection:
+    """Reuse the response cache database and create the embeddings table if needed"""
+    connection = llm_cache.get_connection()
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(semantic_cache)")}
+    if columns and "model" not in columns:
+        # Tables from before entries were scoped by model cannot be filtered or expired
+        connection.execute("DROP TABLE semantic_cache")
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS semantic_cache (
+            source TEXT,
+            model TEXT,
+            lang TEXT,
+            kind TEXT,
+            embedding BLOB,
+            value TEXT,
+            ts INTEGER,
+            PRIMARY KEY (source, model, lang, kind)
+        )
+        """
+    )
+    return connection
+
+def _load_entries() -> Dict[Tuple[str, str], Tuple[list, List[str]]]:
+    """Load the stored embeddings of the configured model into memory on first use"""
+    global _entries
+    if _entries is None:
+        import numpy as np
+
+        _entries = {}
+        rows = _get_connection().execute(
+            "SELECT lang, kind, embedding, value FROM semantic_cache WHERE model = ?",
+            (Config.MODEL_NAME,)
+        )
+        for lang, kind, embedding, value in rows:
+            vectors, values = _entries.setdefault((lang, kind), ([], []))
+            vectors.append(np.frombuffer(embedding, dtype=np.float32))
+            values.append(value)
+    return _entries
+
+def _embed(texts: List[str]):
+    """Embed texts in one batch as normalized float32 vectors, one row per text"""
+    import numpy as np
+
+    embeddings = _get_model().encode(texts, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+async def lookup_many(texts: List[str], lang: str, kind: str) -> List[Optional[str]]:
+    """
+    Find the cached values of the most similar previously seen texts
+
+    All texts are embedded in one batch in a worker thread, so the event loop
+    is not blocked by the model.
+
+    Args:
+        texts: Input texts of the requests
+        lang: Target language
+        kind: Type of task
+
+    Returns:
+        For each text, the cached value if the best match is above
+        Config.SEMANTIC_CACHE_THRESHOLD, otherwise None
+    """
+    import numpy as np
+
+    vectors, values = _load_entries().get((lang, kind), ([], []))
+    if not vectors or not texts:
+        return [None] * len(texts)
+
+    matrix = _matrices.get((lang, kind))
+    if matrix is None or len(matrix) != len(vectors):
+        matrix = np.vstack(vectors)
+        _matrices[(lang, kind)] = matrix
+
+    # Embeddings are normalized, so the dot product is the cosine similarity
+    similarities = await asyncio.to_thread(_embed, texts) @ matrix.T
+    results: List[Optional[str]] = []
+    for row in similarities:
+        best = int(np.argmax(row))
+        results.append(values[best] if row[best] > Config.SEMANTIC_CACHE_THRESHOLD else None)
+    return results
+
+async def add(text: str, value: str, lang: str, kind: str) -> None:
+    """
+    Store a value under the embedding of its input text
+
+    Args:
+        text: Input text of the request
+        value: Response to cache
+        lang: Target language
+        kind: Type of task
+    """
+    embedding = (await asyncio.to_thread(_embed, [text]))[0]
+    vectors, values = _load_entries().setdefault((lang, kind), ([], []))
+    vectors.append(embedding)
+    values.append(value)
+
+    connection = _get_connection()
+    connection.execute(
+        "INSERT OR REPLACE INTO semantic_cache (source, model, lang, kind, embedding, value, ts) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (text, Config.MODEL_NAME, lang, kind, embedding.tobytes(), value, int(time.time()))
+    )
+    connection.commit()
@@ -1,17 +1,24 @@
 """
 State definition for the Jupyter Notebook Translator Agent
 """
-from typing import TypedDict, List, Dict, Optional
+import operator
+from typing import Annotated, TypedDict, List, Dict, Optional, Tuple
 
 class AgentState(TypedDict):
     """
     Represents the state of the notebook processing workflow.
+    
+    Cells are kept in JSON-Lines staging files rather than in the state, so
+    only their (offset, length) entries travel between nodes.
     """
     input_path: str                     # Path to the original .ipynb file
     output_path: str                    # Path for the new, translated .ipynb file
-    notebook_content: Dict              # The entire notebook structure, parsed by nbformat
-    processed_cells: List[Dict]         # List of cells after processing
+    notebook_meta: Dict                 # Notebook fields other than cells (metadata, nbformat version)
+    raw_cells_path: str                 # JSON-Lines staging file with the original cells
+    cell_index: List[Tuple[int, int]]   # (offset, length) of each original cell in raw_cells_path
+    output_staging_path: str            # JSON-Lines staging file with the processed cells
+    blob_dir: str                       # Content-addressed store for large cell outputs
+    output_cell_index: Annotated[List[Tuple[int, int]], operator.add]  # (offset, length) of each processed cell; nodes append
     target_language: str                # The language to translate to (e.g., "Chinese", "Spanish", "French", etc.)
-    current_cell_index: int             # Index of the current cell being processed
-    total_cells: int                    # Total number of cells in the notebook
-    error_message: Optional[str]        # Error message if processing fails 
\ No newline at end of file
+    strict: bool                        # Validate the notebook against the nbformat schema and reject invalid ones
+    error_message: Optional[str]        # Error message if processing fails
@@ -1,21 +1,61 @@
 """
 Main LangGraph workflow for Jupyter Notebook translation
 """
+import functools
+import hashlib
+import logging
+import math
+import orjson
+from pathlib import Path
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 from langgraph.graph import StateGraph, START, END
-from typing import Any, Dict
+from typing import Any, Dict, Tuple
+from config import Config
 from state import AgentState
-from notebook_io import load_and_parse_notebook, rebuild_notebook
+from notebook_io import load_and_parse_notebook, rebuild_notebook, cleanup_staging, staging_paths
 from cell_processors import (
-    process_markdown_cell, 
-    process_code_cell, 
-    route_cell_processing,
-    skip_unsupported_cell
+    process_cells,
+    translate_notebook
 )
 
-def create_notebook_translator_workflow():
+logger = logging.getLogger(__name__)
+
+# Most steps a run may take; the whole notebook is handled inside single nodes,
+# so the graph depth must not grow with the number of cells
+MAX_GRAPH_DEPTH = 8
+
+def _graph_depth(compiled_workflow) -> float:
+    """
+    Count the nodes on the longest path from START to END
+    
+    Args:
+        compiled_workflow: Compiled StateGraph workflow
+    
+    Returns:
+        Number of nodes on the longest path, or math.inf if the graph has a cycle
+    """
+    graph = compiled_workflow.get_graph()
+    successors: Dict[str, list] = {}
+    for edge in graph.edges:
+        successors.setdefault(edge.source, []).append(edge.target)
+    
+    def depth(node: str, visiting: frozenset) -> float:
+        if node == END:
+            return 0
+        if node in visiting:
+            return math.inf
+        return 1 + max((depth(target, visiting | {node}) for target in successors.get(node, [])), default=0)
+    
+    # START itself is not a step
+    return depth(START, frozenset()) - 1
+
+def create_notebook_translator_workflow(checkpointer=None):
     """
     Create and return the compiled LangGraph workflow for notebook translation
     
+    Args:
+        checkpointer: Optional LangGraph checkpointer that persists the state after every step
+    
     Returns:
         Compiled StateGraph workflow
     """
@@ -25,127 +65,180 @@ def create_notebook_translator_workflow():
     
     # Add nodes
     workflow.add_node("load_and_parse_notebook", load_and_parse_notebook)
-    workflow.add_node("process_markdown_cell", process_markdown_cell)
-    workflow.add_node("process_code_cell", process_code_cell)
-    workflow.add_node("skip_unsupported_cell", skip_unsupported_cell)
+    workflow.add_node("translate_notebook", translate_notebook)
+    workflow.add_node("process_cells", process_cells)
     workflow.add_node("rebuild_notebook", rebuild_notebook)
     
     # Define edges
     # Start with loading the notebook
     workflow.add_edge(START, "load_and_parse_notebook")
     
-    # After loading, route to appropriate cell processing
-    workflow.add_conditional_edges(
-        "load_and_parse_notebook",
-        route_cell_processing,
-        {
-            "process_markdown_cell": "process_markdown_cell",
-            "process_code_cell": "process_code_cell",
-            "skip_unsupported_cell": "skip_unsupported_cell",
-            "rebuild_notebook": "rebuild_notebook",
-            "END": END
-        }
-    )
-    
-    # After processing markdown, route to next cell
-    workflow.add_conditional_edges(
-        "process_markdown_cell",
-        route_cell_processing,
-        {
-            "process_markdown_cell": "process_markdown_cell",
-            "process_code_cell": "process_code_cell",
-            "skip_unsupported_cell": "skip_unsupported_cell",
-            "rebuild_notebook": "rebuild_notebook", 
-            "END": END
-        }
-    )
-    
-    # After processing code, route to next cell
-    workflow.add_conditional_edges(
-        "process_code_cell", 
-        route_cell_processing,
-        {
-            "process_markdown_cell": "process_markdown_cell",
-            "process_code_cell": "process_code_cell",
-            "skip_unsupported_cell": "skip_unsupported_cell",
-            "rebuild_notebook": "rebuild_notebook",
-            "END": END
-        }
-    )
-    
-    # After skipping unsupported cell, route to next cell
-    workflow.add_conditional_edges(
-        "skip_unsupported_cell",
-        route_cell_processing,
-        {
-            "process_markdown_cell": "process_markdown_cell",
-            "process_code_cell": "process_code_cell",
-            "skip_unsupported_cell": "skip_unsupported_cell",
-            "rebuild_notebook": "rebuild_notebook",
-            "END": END
-        }
-    )
+    # After loading, translate the whole notebook in one batched pass
+    workflow.add_edge("load_and_parse_notebook", "translate_notebook")
+    
+    # translate_notebook routes itself with a Command: to rebuild on success,
+    # to the per-cell fallback if the batched pass fails, or to END on error
+    
+    # The fallback processes every cell in one node, then the notebook is rebuilt
+    workflow.add_edge("process_cells", "rebuild_notebook")
     
     # After rebuilding, we're done
     workflow.add_edge("rebuild_notebook", END)
     
     # Compile the workflow
-    compiled_workflow = workflow.compile()
+    compiled_workflow = workflow.compile(checkpointer=checkpointer)
+    
+    # Catch regressions that reintroduce per-cell loops before they hit the recursion limit
+    assert _graph_depth(compiled_workflow) <= MAX_GRAPH_DEPTH, "Workflow graph is deeper than MAX_GRAPH_DEPTH"
     
     return compiled_workflow
 
-def run_notebook_translation(input_path: str, target_language: str) -> dict:
+@functools.lru_cache(maxsize=1)
+def _get_workflow():
+    """Compile the workflow once per process"""
+    return create_notebook_translator_workflow()
+
+class OrjsonSerializer(JsonPlusSerializer):
+    """
+    Checkpoint serializer that encodes plain JSON values with orjson
+    
+    Values orjson cannot encode as-is (bytes, dataclasses, LangGraph objects)
+    fall back to the default msgpack encoding, so they round-trip unchanged.
+    """
+    
+    # Dataclasses and datetimes must keep their type, so orjson refuses them
+    _OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS
+    
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if obj is not None and not isinstance(obj, (bytes, bytearray)):
+            try:
+                return "orjson", orjson.dumps(obj, option=self._OPTIONS)
+            except TypeError:
+                pass
+        return super().dumps_typed(obj)
+    
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        if data[0] == "orjson":
+            return orjson.loads(data[1])
+        return super().loads_typed(data)
+
+async def _invoke_with_checkpoints(initial_state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the workflow with a SQLite checkpointer so an interrupted run can be resumed
+    
+    The thread id is derived from the input path, its modification time and
+    size, and the target language. If the last run of that thread stopped
+    before the end, it continues from its last completed step instead of
+    starting over.
+    
+    Args:
+        initial_state: Initial state of a fresh run
+        config: Run configuration
+        
+    Returns:
+        Final state dictionary
+    """
+    try:
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            "CHECKPOINT=1 requires langgraph-checkpoint-sqlite. "
+            "Install it with: pip install langgraph-checkpoint-sqlite"
+        ) from e
+    
+    checkpoint_path = Path(Config.CHECKPOINT_PATH).expanduser()
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    # An edited notebook gets a new thread, so cells staged from the old version are never resumed
+    input_file = Path(initial_state["input_path"]).resolve()
+    file_state = ""
+    if input_file.exists():
+        file_stat = input_file.stat()
+        file_state = f"{file_stat.st_mtime_ns}|{file_stat.st_size}"
+    run_key = f"{input_file}|{file_state}|{initial_state['target_language']}"
+    thread_id = hashlib.sha256(run_key.encode('utf-8')).hexdigest()
+    config = {**config, "configurable": {"thread_id": thread_id}}
+    
+    async with aiosqlite.connect(checkpoint_path) as connection:
+        checkpointer = AsyncSqliteSaver(connection, serde=OrjsonSerializer())
+        workflow = create_notebook_translator_workflow(checkpointer)
+        snapshot = await workflow.aget_state(config)
+        if snapshot.next:
+            logger.info("⏯️ Resuming interrupted run at: %s", ", ".join(snapshot.next))
+            final_state = await workflow.ainvoke(None, config=config)
+        else:
+            # A finished run is dropped first, otherwise output_cell_index would append to it
+            await checkpointer.adelete_thread(thread_id)
+            final_state = await workflow.ainvoke(initial_state, config=config)
+        await checkpointer.adelete_thread(thread_id)
+    
+    return final_state
+
+async def run_notebook_translation(input_path: str, target_language: str, strict: bool = False) -> dict:
     """
     Run the complete notebook translation workflow
     
     Args:
         input_path: Path to the input Jupyter notebook
         target_language: Target language for translation
+        strict: Reject notebooks that do not match the nbformat schema
         
     Returns:
         Final state dictionary with results
     """
-    # Create the workflow
-    workflow = create_notebook_translator_workflow()
-    
     # Initial state
     initial_state = {
         "input_path": input_path,
         "target_language": target_language,
-        "notebook_content": {},
-        "processed_cells": [],
-        "current_cell_index": 0,
-        "total_cells": 0,
+        "strict": strict,
+        "notebook_meta": {},
+        "raw_cells_path": "",
+        "cell_index": [],
+        "output_staging_path": "",
+        "output_cell_index": [],
+        "blob_dir": "",
         "output_path": "",
         "error_message": None
     }
     
-    print(f"🚀 Starting notebook translation workflow...")
-    print(f"📁 Input: {input_path}")
-    print(f"🌍 Target language: {target_language}")
-    print("-" * 50)
+    logger.info("🚀 Starting notebook translation workflow...")
+    logger.info("📁 Input: %s", input_path)
+    logger.info("🌍 Target language: %s", target_language)
+    logger.info("-" * 50)
     
-    # Run the workflow with increased recursion limit
+    # Run the workflow; its depth does not depend on the notebook size, so the
+    # default recursion limit is enough and still catches runaway loops
     try:
-        # Configure with higher recursion limit to handle large notebooks
-        config: Dict[str, Any] = {"recursion_limit": 100}  # Increased from default 25
-        final_state = workflow.invoke(initial_state, config=config)
+        config: Dict[str, Any] = {}
+        if Config.CHECKPOINT_ENABLED:
+            final_state = await _invoke_with_checkpoints(initial_state, config)
+        else:
+            # Reuse the compiled workflow; all per-run data lives in the initial state
+            final_state = await _get_workflow().ainvoke(initial_state, config=config)
+        if Config.CHECKPOINT_ENABLED:
+            # The run finished, so its staged files are no longer needed for a resume
+            cleanup_staging(final_state)
         
         if final_state.get("error_message"):
-            print(f"❌ Translation failed: {final_state['error_message']}")
+            logger.error("❌ Translation failed: %s", final_state['error_message'])
         else:
-            print("-" * 50)
-            print(f"✅ Translation completed successfully!")
-            print(f"📄 Output saved to: {final_state['output_path']}")
-            print(f"📊 Processed {len(final_state['processed_cells'])} cells")
+            logger.info("-" * 50)
+            logger.info("✅ Translation completed successfully!")
+            logger.info("📄 Output saved to: %s", final_state['output_path'])
+            logger.info("📊 Processed %s cells", len(final_state['output_cell_index']))
         
         return final_state
         
     except Exception as e:
         error_msg = f"Workflow execution failed: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         return {
             "error_message": error_msg,
             "input_path": input_path,
             "target_language": target_language
-        } 
\ No newline at end of file
+        }
+    
+    finally:
+        # Without checkpoints nothing can resume a failed or interrupted run, so its files always go
+        if not Config.CHECKPOINT_ENABLED:
+            cleanup_staging(staging_paths(input_path)) 
\ No newline at end of file